@@ -1,43 +1,125 @@
+import hashlib
+import json
 from io import BytesIO
-from typing_extensions import List
-from dataclasses import dataclass
+from typing_extensions import ClassVar, Dict, List, TYPE_CHECKING
+from dataclasses import dataclass, field
 from pydantic import BaseModel, Field
-import pandas as pd
 
-@dataclass
+if TYPE_CHECKING: # pandas & pyarrow are imported lazily where used, to keep them out of server start-up
+    import pandas as pd
+    import pyarrow as pa
+
+@dataclass(slots=True)
 class CSVFile():
     """ 
     A structured CSV file provided by the user.
     Attributes:
         name - filename, including file extension (i.e. .csv)
         content - The CSV file loaded as a pandas DataFrame
+        _sample - cached output of sample(), computed once on construction
     """
     name: str
-    content: pd.DataFrame
+    content: "pd.DataFrame"
+    _sample: "FileSample" = field(init=False, repr=False, compare=False)
+
+    # Cells longer than this are truncated in sample(), as long free-text cells add many prompt tokens but little schema information
+    SAMPLE_MAX_CELL_LENGTH: ClassVar[int] = 64
+
+    def __post_init__(self) -> None:
+        # sample() is requested for every agent invocation that needs file context, and content doesn't change, so compute it once
+        self._sample = self._compute_sample()
 
     @classmethod
-    def from_bytesIO(cls, name: str, file: BytesIO) -> "CSVFile":
+    def from_bytes(cls, name: str, data: bytes, column_types: "pa.Schema | Dict[str, pa.DataType] | None" = None) -> "CSVFile":
         """
-        Constructs from a bytesIO stream object 
+        Constructs from the raw bytes of the file
         Args:
             name: name of the file, including extension
-            file: a bytesIO object
+            data: the file's contents
+            column_types: optional known types for (some of) the columns, e.g. when re-reading a file whose types are already known.
+                Arrow skips type inference for the given columns.
         """
-        file.seek(0) # Move file pointer to start of file
-        content = pd.read_csv(file)
-        return cls(name=name, content=content)
+        import pandas as pd
+        import pyarrow as pa
+        from pyarrow import csv as pacsv
+
+        # Arrow's multithreaded CSV reader is substantially faster than pd.read_csv on large uploads.
+        # BufferReader reads the bytes in place, and ArrowDtype keeps columns Arrow-backed rather than converting them to numpy object arrays.
+        try:
+            table = pacsv.read_csv(
+                pa.BufferReader(data), 
+                read_options=pacsv.ReadOptions(use_threads=True, block_size=8 << 20),
+                convert_options=pacsv.ConvertOptions(column_types=column_types),
+            )
+        except pa.ArrowInvalid:
+            # Arrow rejects some CSVs that pandas accepts (e.g. rows missing trailing fields, which pandas fills with nulls), so fall back to pandas for those
+            if isinstance(column_types, pa.Schema):
+                column_types = dict(zip(column_types.names, column_types.types))
+            dtype = {column: pd.ArrowDtype(data_type) for column, data_type in column_types.items()} if column_types else None
+            return cls(name=name, content=pd.read_csv(BytesIO(data), dtype=dtype, dtype_backend="pyarrow"))
 
-    def sample(self) -> List[str]:
+        # Arrow keeps duplicate column names as-is, but they can't be told apart in a DataFrame, so rename them as pandas would
+        table = table.rename_columns(_dedupe_column_names(table.column_names))
+        return cls(name=name, content=table.to_pandas(types_mapper=pd.ArrowDtype))
+
+    def sample(self) -> "FileSample":
         """
-        Returns the first 11 lines of the csv file.
+        Returns the column headers & first 10 rows of the csv file.
         This is useful for providing context to agents about the content of the file.
         Returns:
-            list[str]: The first 11 lines of the csv file: The first line has the column headers, subsequent 10 lines have the data.
-                Each line is a single comma-separated string.
+            FileSample: the file's column headers, and its first 10 rows as lists of cell strings. Cells are truncated to SAMPLE_MAX_CELL_LENGTH characters.
+        """
+        return self._sample
+
+    def unique_columns(self) -> List[str]:
         """
-        columns = ",".join(self.content.columns.values.tolist())
-        rows = self.content.iloc[:10].apply(lambda x: ",".join(x.astype(str)), axis=1).tolist()
-        return [columns] + rows 
+        Returns the columns whose values are unique (and never null) across the whole file - i.e. the candidate unique identifiers.
+        Computed over the full content rather than the sample, so it's a reliable hint for agents that only see the sample.
+        With fewer than 2 rows every column is trivially unique, which says nothing about identifiers, so no columns are returned.
+        """
+        if len(self.content) < 2:
+            return []
+        return [column for column in self.content.columns if self.content[column].is_unique and not self.content[column].hasnans]
+
+    def _compute_sample(self) -> "FileSample":
+        """ Computes the output of sample() from content """
+        import pyarrow as pa
+        import pyarrow.compute as pc
+
+        # Cast & truncate cells column-wise in Arrow's compute kernels - content is Arrow-backed, so this conversion is zero-copy
+        table = pa.Table.from_pandas(self.content.head(10), preserve_index=False)
+        columns = [
+            pc.utf8_slice_codeunits(pc.cast(column, pa.string()).fill_null(""), 0, self.SAMPLE_MAX_CELL_LENGTH).to_pylist()
+            for column in table.columns
+        ]
+        return FileSample(columns=table.column_names, rows=[list(row) for row in zip(*columns)])
+
+
+def _dedupe_column_names(names: List[str]) -> List[str]:
+    """ Renames repeated column names the way pd.read_csv does - the 2nd "id" column becomes "id.1", the 3rd "id.2", etc. """
+    taken = set(names)
+    counts: Dict[str, int] = {}
+    deduped = []
+    for name in names:
+        if name not in counts:
+            counts[name] = 0
+            deduped.append(name)
+            continue
+        new_name = name
+        while new_name in taken:
+            counts[name] += 1
+            new_name = f"{name}.{counts[name]}"
+        taken.add(new_name)
+        deduped.append(new_name)
+    return deduped
+
+
+class FileSample(BaseModel):
+    """
+    A sample of a CSV file, stored as column headers + rows (rather than as joined CSV lines), so it can be analysed without re-parsing.
+    """
+    columns: List[str] = Field(description="The file's column headers")
+    rows: List[List[str]] = Field(description="The file's first rows, each a list of cell values in column order")
 
 
 class EntityType(BaseModel):
@@ -61,4 +143,38 @@ class StructuredSchema(BaseModel):
     """
     entity_types: List[EntityType] = Field(description="List of proposed entity types")
     relationship_types: List[RelationshipType] = Field(description="List of proposed relationship types")
-    
\ No newline at end of file
+    
+
+    def canonical_key(self) -> str:
+        """
+        Returns a key identifying the schema's content regardless of ordering & label casing - 
+        i.e. two schemas have the same key if they have the same entity types (with the same fields) and relationship types.
+        """
+        entity_types = sorted((e.label.strip().upper(), sorted(e.fields)) for e in self.entity_types)
+        relationship_types = sorted(tuple(name.strip().upper() for name in (r.source, r.label, r.target)) for r in self.relationship_types)
+        return hashlib.sha256(json.dumps([entity_types, relationship_types]).encode()).hexdigest()
+
+    @classmethod
+    def merge(cls, schemas: List["StructuredSchema"]) -> "StructuredSchema":
+        """
+        Merges several schemas into one.
+        Entity types with the same label (ignoring case) are combined into one, with the union of their fields;
+        relationship types with the same (source, label, target) triple (ignoring case) are deduplicated.
+        """
+        entity_types: Dict[str, EntityType] = {}
+        relationship_types: Dict[tuple, RelationshipType] = {}
+
+        for schema in schemas:
+            for entity_type in schema.entity_types:
+                key = entity_type.label.strip().upper()
+                if key not in entity_types:
+                    entity_types[key] = EntityType(label=entity_type.label, fields=list(dict.fromkeys(entity_type.fields)))
+                else:
+                    merged_fields = entity_types[key].fields
+                    merged_fields.extend(f for f in entity_type.fields if f not in merged_fields)
+
+            for relationship_type in schema.relationship_types:
+                key = tuple(name.strip().upper() for name in (relationship_type.source, relationship_type.label, relationship_type.target))
+                relationship_types.setdefault(key, relationship_type)
+
+        return cls(entity_types=list(entity_types.values()), relationship_types=list(relationship_types.values()))
@@ -1,9 +1,61 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from importlib.metadata import version
 from io import BytesIO
-from markitdown import MarkItDown
+from pathlib import Path
 from dataclasses import dataclass
+from typing_extensions import Any, ClassVar
 
+logger = logging.getLogger(__name__)
 
-@dataclass
+# Disk cache of converted documents, keyed by a hash of the converter version & raw file bytes.
+# Kept in this subdir of the user's cache dir ($XDG_CACHE_HOME, else ~/.cache), accessible only to the user, so other local users can't read or plant entries.
+_CACHE_SUBDIR = Path("rag-graph-constructor") / "markitdown"
+# Least recently used entries are evicted beyond this many
+_CACHE_MAX_ENTRIES = 256
+
+
+def _cache_dir() -> Path | None:
+    """ 
+    Returns the cache dir, creating it if needed - or None if it can't be resolved or created, 
+    or isn't private to the current user (so mustn't be trusted) 
+    """
+    try:
+        cache_dir = Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache") / _CACHE_SUBDIR
+        cache_dir.mkdir(mode=0o700, parents=True, exist_ok=True)
+        stat = cache_dir.stat()
+    except (OSError, RuntimeError): # RuntimeError if the home dir can't be resolved
+        return None
+    if stat.st_uid != os.getuid() or stat.st_mode & 0o077: # Pre-existing dir owned by, or accessible to, someone else
+        return None
+    return cache_dir
+
+
+def _write_cache_entry(cache_path: Path, entry: dict) -> None:
+    """ Writes a cache entry atomically, so concurrent readers never see a partially written entry """
+    fd, tmp_path = tempfile.mkstemp(dir=cache_path.parent, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, cache_path)
+    finally:
+        Path(tmp_path).unlink(missing_ok=True) # Only still exists if the write failed
+
+
+def _evict_cache_entries(cache_dir: Path) -> None:
+    """ Deletes the least recently used entries beyond _CACHE_MAX_ENTRIES """
+    try:
+        entries = sorted(cache_dir.glob("*.json"), key=lambda path: path.stat().st_mtime, reverse=True)
+        for path in entries[_CACHE_MAX_ENTRIES:]:
+            path.unlink(missing_ok=True)
+    except OSError: # e.g. an entry removed concurrently - eviction is retried on the next write anyway
+        pass
+
+
+@dataclass(slots=True)
 class UnstructuredFile():
     """
     An unstructured text-based file provided by the user. Can be of formats "txt", "pdf", "md", "docx", "html".
@@ -17,14 +69,39 @@ class UnstructuredFile():
     doc_title: str | None
     content: str
 
+    # Shared MarkItDown converter, built on first conversion - markitdown pulls in the PDF/Office stacks at import,
+    # and its converter registry is costly to build but read-only once built
+    _md: ClassVar[Any] = None
+
     @classmethod
-    def from_bytesIO(cls, name: str, file: BytesIO) -> "UnstructuredFile":
+    def from_bytes(cls, name: str, data: bytes) -> "UnstructuredFile":
         """
-        Constructs from a bytesIO stream object 
+        Constructs from the raw bytes of the file.
+        Conversions are cached on disk by file content, so re-uploading an identical file skips the markdown conversion.
         Args:
             name: name of the file, including extension
-            file: a bytesIO object
+            data: the file's contents
         """
-        md = MarkItDown()
-        conversion = md.convert(file)
+        cache_dir = _cache_dir()
+        cache_key = hashlib.blake2b(data, digest_size=16, key=version("markitdown").encode()).hexdigest() # Keyed by the version, so upgrades don't serve stale conversions
+        cache_path = cache_dir / f"{cache_key}.json" if cache_dir is not None else None
+
+        if cache_path is not None and cache_path.exists():
+            try:
+                cached = json.loads(cache_path.read_text(encoding="utf-8"))
+                cache_path.touch() # Mark as recently used
+                return cls(name=name, doc_title=cached["doc_title"], content=cached["content"])
+            except (OSError, ValueError, KeyError): # Unreadable entry - reconvert & overwrite
+                pass
+
+        if cls._md is None:
+            from markitdown import MarkItDown
+            cls._md = MarkItDown()
+        conversion = cls._md.convert(BytesIO(data))
+        if cache_path is not None:
+            try:
+                _write_cache_entry(cache_path, {"doc_title": conversion.title, "content": conversion.markdown})
+                _evict_cache_entries(cache_dir)
+            except OSError as e: # The cache is only an optimization, so a failed write (e.g. disk full) mustn't fail the conversion
+                logger.warning(f"Could not cache conversion of {name}: {e}")
         return cls(name=name, doc_title=conversion.title, content=conversion.markdown)
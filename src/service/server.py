@@ -1,4 +1,9 @@
 import logging
+import threading
+import time
+from collections import OrderedDict
+from uuid import uuid4
+from concurrent.futures import ThreadPoolExecutor
 from flask import Flask, redirect, request, render_template, session
 from flask_session import Session
 from redis import Redis
@@ -15,44 +20,93 @@ app = Flask(__name__, template_folder="templates")
 # Support for serverside sessions
 SESSION_TYPE = 'redis'
 SESSION_REDIS = Redis(host='localhost', port=6379)
+SESSION_SERIALIZATION_FORMAT = 'msgpack' # flask-session encodes the session with msgspec; Messages are plain dicts so need no custom hooks
 app.config.from_object(__name__)
 Session(app)
 logger.info("CONNECTED TO REDIS SERVER")
 
+# Cap on threads used to parse uploaded files concurrently
+MAX_UPLOAD_WORKERS = 8
+
+# In-process store of each session's workflow (and thereby its uploaded files), mapped by the session's workflow_id -> (expiry time.monotonic() time, workflow).
+# Kept out of the session so file contents aren't re-serialized to redis on every request.
+# Bounded, as abandoned sessions never discard their workflows: a workflow expires WORKFLOW_TTL_SECONDS after it was last used, 
+# and the least recently used workflow is evicted once MAX_WORKFLOWS are held. An evicted session is sent back to re-upload its files.
+# NOTE: The store lives in one process's memory, so the server must run as a single process (threads are fine) - 
+# with multiple worker processes, a session's requests would only find its workflow on the worker that handled its upload.
+WORKFLOW_TTL_SECONDS = 2 * 60 * 60
+MAX_WORKFLOWS = 32
+WORKFLOWS: OrderedDict[str, tuple[float, KnowledgeGraphCreationWorkflow]] = OrderedDict()
+_workflows_lock = threading.Lock()
+
+
+def store_workflow(workflow_id: str, workflow: KnowledgeGraphCreationWorkflow) -> None:
+    """ Adds a workflow to WORKFLOWS, evicting expired & least recently used workflows to stay within the bounds """
+    with _workflows_lock:
+        now = time.monotonic()
+        for expired_id in [stored_id for stored_id, (expires_at, _) in WORKFLOWS.items() if expires_at <= now]:
+            del WORKFLOWS[expired_id]
+        while len(WORKFLOWS) >= MAX_WORKFLOWS:
+            WORKFLOWS.popitem(last=False)
+        WORKFLOWS[workflow_id] = (now + WORKFLOW_TTL_SECONDS, workflow)
+
+
+def get_workflow(workflow_id: str | None) -> KnowledgeGraphCreationWorkflow | None:
+    """ Returns the workflow with the given id (refreshing its expiry), or None if there's none or it has expired """
+    with _workflows_lock:
+        entry = WORKFLOWS.pop(workflow_id, None)
+        if entry is None or entry[0] <= time.monotonic():
+            return None
+        WORKFLOWS[workflow_id] = (time.monotonic() + WORKFLOW_TTL_SECONDS, entry[1]) # Re-inserted, so it's now the most recently used
+        return entry[1]
+
+
+def discard_workflow(workflow_id: str | None) -> None:
+    """ Removes the workflow with the given id from WORKFLOWS, if present """
+    with _workflows_lock:
+        WORKFLOWS.pop(workflow_id, None)
+
 
 @app.route("/", methods=["GET"])
 def root():
     return render_template("file_upload.html")
 
 
+def parse_uploaded_file(file) -> CSVFile | UnstructuredFile:
+    """ Parses an uploaded werkzeug FileStorage as a CSVFile if it has a '.csv' extension, else as an UnstructuredFile """
+    data = file.read()
+    if file.filename.endswith('.csv'): # CSV files
+        return CSVFile.from_bytes(file.filename, data)
+    return UnstructuredFile.from_bytes(file.filename, data) # Unstructured files
+
+
 @app.route("/upload_files", methods=["POST"])
 def upload_files():
 
-    # Initialize session storage for files & a message history list
-    session['csv_files'] = {} # Map of filename string (with '.csv' extension) -> CSVFile
-    session['unstructured_files'] = {} # Map of filename string (with extension) -> UnstructuredFile
+    # Initialize session storage for a message history list
     session['messages'] = []
 
-    for file in request.files.getlist("fileUploader"):
-
-        if file.filename.endswith('.csv'): # CSV files
-            csv_file = CSVFile.from_bytesIO(file.filename, file.stream._file)
-            session['csv_files'][file.filename] = csv_file
-
-        else: # Unstructured files
-            unstructured_file = UnstructuredFile.from_bytesIO(file.filename, file.stream._file)
-            session['unstructured_files'][file.filename] = unstructured_file
-
-    logger.info(f"CSV FILES: { [filename for filename in session['csv_files'].keys()]}")
-    logger.info(f"UNSTRUCTURED FILES: { [filename for filename in session['unstructured_files'].keys()] }")
-
-    """
-    # Initialize top-level workflow and store in session
-    session['workflow'] = KnowledgeGraphCreationWorkflow(
-        csv_files=session['csv_files'],
-        unstructured_files=session['unstructured_files']
-    )
-    """
+    # Parse files concurrently - CSV parsing & markdown conversion run mostly in native code that releases the GIL
+    files = request.files.getlist("fileUploader")
+    if files:
+        with ThreadPoolExecutor(max_workers=min(MAX_UPLOAD_WORKERS, len(files))) as executor:
+            parsed_files = list(executor.map(parse_uploaded_file, files))
+    else:
+        parsed_files = []
+
+    csv_files = {file.name: file for file in parsed_files if isinstance(file, CSVFile)} # Map of filename string (with '.csv' extension) -> CSVFile
+    unstructured_files = {file.name: file for file in parsed_files if isinstance(file, UnstructuredFile)} # Map of filename string (with extension) -> UnstructuredFile
+
+    logger.info(f"CSV FILES: { [filename for filename in csv_files.keys()]}")
+    logger.info(f"UNSTRUCTURED FILES: { [filename for filename in unstructured_files.keys()] }")
+
+    # Initialize top-level workflow and store in process memory, with only its id going in the session
+    discard_workflow(session.get('workflow_id')) # Discard the workflow from any previous upload in this session
+    session['workflow_id'] = uuid4().hex
+    store_workflow(session['workflow_id'], KnowledgeGraphCreationWorkflow(
+        csv_files=csv_files,
+        unstructured_files=unstructured_files
+    ))
     return redirect("/chat")
 
 
@@ -73,13 +127,11 @@ async def send_message():
     session['messages'].append(user_message)
 
     # Run workflow if this is user's 1st message
-    # NOTE: Workflow initialized here as part of placeholder
     # ENTIRE WORKFLOW IS RUN WITHIN THIS ENDPT. USER INPUT GOT VIA CLI
     if len(session['messages']) == 1:
-        workflow = KnowledgeGraphCreationWorkflow(
-                csv_files=session['csv_files'],
-                unstructured_files=session['unstructured_files']
-        )
+        workflow = get_workflow(session.get('workflow_id'))
+        if workflow is None: # e.g. server restarted, or workflow expired/evicted, since upload - files must be re-uploaded
+            return redirect("/")
         await workflow.run(user_message)
 
     return redirect("/chat")
@@ -25,11 +25,13 @@ class KnowledgeGraphCreationWorkflow:
             csv_files - CSV (structured) files provided by user as a map of: filename string (with '.csv' extension) -> CSVFile
             unstructured_files - Unstructured files (i.e. "txt", "pdf", "md", "docx", "html") provided by user as a map of: filename string (with extension) -> UnstructuredFile
             user_goal - finalized/approved user's objective, initially empty/none but set by user intent loop
+            user_intent_last_output - the user intent loop's state at the end of its last iteration, set by the loop (see UserIntentLoop.LAST_OUTPUT_KEY)
 
         """
         csv_files: Dict[str, CSVFile]
         unstructured_files: Dict[str, UnstructuredFile]
         user_goal: UserGoal = None
+        user_intent_last_output: UserIntentLoop.LoopState = None
 
 
     def __init__(self, csv_files: Dict[str, CSVFile], unstructured_files: Dict[str, UnstructuredFile]) -> None:
@@ -1,8 +1,8 @@
 from typing import Dict, TypedDict
 from agno.workflow import Workflow, Step, StepInput, StepOutput
 
-from src.common import UserGoal
-from src.common.structured import CSVFile
+from ...common import UserGoal
+from ...common.structured import CSVFile
 
 class CSVWorkflow:
     """
@@ -1,12 +1,243 @@
-from typing import List, Dict
+import asyncio
+import hashlib
+import json
+import logging
+import re
+import time
+from typing import Any, List, Dict, Tuple
 from pydantic import BaseModel, Field
 from textwrap import dedent
-from agno.workflow import  Loop, Step, StepInput, StepOutput
+from agno.workflow import  Loop, Step, StepInput, StepOutput, Workflow
 from agno.agent import Agent
 from agno.models.google.gemini import Gemini
+from google.genai import types
+
+from ...common import UserGoal
+from ...common.structured import CSVFile, EntityType, FileSample, RelationshipType, StructuredSchema
+
+logger = logging.getLogger(__name__)
+
+# Lifetime of the Gemini context caches holding the agents' instructions
+INSTRUCTION_CACHE_TTL_SECONDS = 600
+
+# Gemini context caches holding agent instructions, shared by all SchemaCriticLoop instances (e.g. the runs of run_batch), as the instructions are static.
+# Mapped by (model id, instructions hash) -> (expiry time.monotonic() time, task creating the cache - resolving to its name, or None if it couldn't be created).
+_instruction_caches: Dict[Tuple[str, str], Tuple[float, "asyncio.Task[str | None]"]] = {}
+
+# With more files than this, the first schema proposal is drafted from shards of the files in parallel (see propose_sharded_schema)
+SHARDED_PROPOSAL_FILE_THRESHOLD = 8
+PROPOSAL_SHARDS = 4
 
-from src.common import UserGoal
-from src.common.structured import StructuredSchema
+# In-process cache of agent responses, mapped by a hash of (agent name, model, input state) -> (expiry time.monotonic() time, response content).
+# Repeated runs over the same files/goal (e.g. retries, or re-uploads while iterating) replay identical agent inputs, so hits skip the LLM call entirely.
+# Only used for the critic, whose verdict on a given schema is worth reusing. The proposal agent is never cached: its output is sampled, 
+# so a retry of a loop that failed to reach approval must be able to propose something different.
+RESPONSE_CACHE_TTL_SECONDS = 3600
+RESPONSE_CACHE_MAX_ENTRIES = 256
+_response_cache: Dict[str, Tuple[float, Any]] = {}
+
+# The critic agent's entire response when it approves a schema
+CRITIC_APPROVAL = "APPROVED"
+
+# Schema definition & design rules, shared by the proposal & critic agents' instructions
+_SCHEMA_DEFINITION = dedent("""\
+    A knowledge graph schema consists of 2 lists:
+    - a list of entity types (nodes) (e.g. Person, Company, Product). These have fields/attributes (e.g. for Person, fields could be name, age, address).
+    - a list of relationship types (edges). Each relationship type is represented by 3 components: SOURCE_ENTITY_TYPE, RELATIONSHIP_TYPE, DESTINATION_ENTITY_TYPE;
+        thus specifying the concerned entity types as well as the nature of the relationship itself. e.g. [Person, WORKS_AT, Company], [Product, MANUFACTURED_BY, Company].
+        Relationships do not have their own fields/attribute lists.
+""")
+
+_SCHEMA_RULES = dedent("""\
+    The resulting schema should be a connected graph, with no isolated components.
+
+    ## General guidance for identifying a node or a relationship
+    - If the file name is singular and has only 1 unique identifier it is likely a node
+    - If the file name is a combination of two things, it is likely a full relationship
+    - If the file name sounds like a node, but there are multiple unique identifiers, that is likely a node with some relationships to other nodes.
+
+    ## Design rules for nodes
+    - Nodes will have unique identifiers.
+    - Nodes _may_ have "foreign key" identifiers that indicate relationships.
+
+    ## Design rules for relationships
+
+    Relationships appear in two ways: full relationships and reference relationships.
+
+    ### Full relationships
+    - Full relationships appear in dedicated relationship files, often having a filename that references two entities
+    - These represent many-to-many relationships.
+    - Full relationships typically have foreign key references to a source and destination entity.
+    - Full relationships _do not have_ unique identifiers, but instead have references to the primary keys of the source and destination nodes.
+    - The absence of a single, unique identifier is a strong indicator that a file is a full relationship.
+
+    ### Reference relationships
+    - Reference relationships appear as foreign key references in node files
+    - These represent one-to-one or many-to-one relationships.
+    - Reference relationship foreign key column names often hint at the destination node and relationship type
+    - References may be hierarchical container relationships, with terminology revealing parent-child, "has", "contains", membership, or similar relationship
+    - References may be peer relationships, that is often a self-reference to a similar class of nodes. For example, "knows" or "see also"
+
+    ### Relationship or Entity?
+    For full, many-to-many relationships, it sometimes makes sense to have that "relationship" exist in the schema as an entity in and of itself.
+    This is the case when the "relationship" has properties/fields of it's own. e.g. relationship PURCHASED between USER and PRODUCT might have fields (DATE, PAYMENT_METHOD etc.) so
+    may be best off as it's own entity, with relationships tying it to the USER and the PRODUCTS.
+
+    ## ADDITIONAL POINTS
+    - This is a graph database, not a relational database schema. Entities should be connected solely through relationships, not through foreign key reference fields. Thus any foreign key fields in the CSV files should be omitted from the graph database schema.
+    - For any entity type, assume that the "<entity>_id" field is the unique identifier field.
+""")
+
+_PROPOSAL_INSTRUCTIONS = dedent("""
+    You are an expert at knowledge graph schema design. Your task is to propose a schema for a knowledge graph that can fulfill a provided user goal. 
+    The knowledge graph will be created from some CSV files. A sample of each file (its column headings and first 10 rows) will be provided to you. Use them to ascertain a schema that fulfills the user goal.
+    You'll also be given the columns of each file whose values are unique across the entire file (likely_unique_ids); these are the candidate unique identifiers.
+    You'll also be given feedback from a critic agent on a previous proposed schema. Use this to refine the schema.
+    For your first proposal, you may instead be given a draft schema derived mechanically from the filenames and identifiers using the rules below. Verify and refine it rather than starting from scratch.
+
+""") + _SCHEMA_DEFINITION + dedent("""
+    Note that you are not being asked to extract instances of entities (e.g Joe, Mark, Devin) or relationships (e.g. Joe likes Mark), just the high-level entity types and relationship types.
+
+    # SCHEMA RULES & GUIDANCE
+    Every file in the approved files list will become either a node or a relationship. Determining whether a file likely represents a node or a relationship is based on a hint from the filename
+    (is it a single thing or two things) and the identifiers found within the file. Because unique identifiers are so important for determining the structure of the graph, 
+    always verify the uniqueness of suspected unique identifiers by checking them against likely_unique_ids.
+
+""") + _SCHEMA_RULES
+
+_CRITIC_INSTRUCTIONS = dedent("""
+    You are an expert at knowledge graph schema design. Your task is to critique the proposed knowledge graph schema put forth by a proposal agent.
+
+""") + _SCHEMA_DEFINITION + dedent("""
+    The proposed schema should be evaulated against the user goal (provided as an input) to determine it's alignment with the user's objective.
+    The knowledge graph will be created from some CSV files. The column headings of each file will be provided to you, 
+    along with the columns of each file whose values are unique across the entire file (likely_unique_ids), so you can test the accuracy of the proposed schema.
+
+    Based on the proposed entity types and relationship types, provide feedback on their relevance to the user's objective and their completeness.
+    If you believe the proposed schema is (sufficiently) appropriate and complete, respond with only the word "APPROVED".
+
+    When providing feedback, aim to be concise and specific: clearly mention any suggested changes, and do not provide generic feedback.
+    Do not provide any positive/affirmative feedback - only suggest changes or state "APPROVED".
+
+    # SCHEMA RULES & GUIDANCE
+    Every file in the approved files list will become either a node or a relationship. Determining whether a file likely represents a node or a relationship is based on a hint from the filename
+    (is it a single thing or two things) and the identifiers found within the file. Because unique identifiers are so important for determining the structure of the graph, 
+    always verify the uniqueness of the proposed schema's unique identifiers by checking them against likely_unique_ids.
+
+""") + _SCHEMA_RULES
+
+
+def is_approval(feedback: str) -> bool:
+    """ 
+    Whether the critic agent's feedback approves the schema - i.e. is exactly CRITIC_APPROVAL, give or take surrounding whitespace & punctuation.
+    Anything more (e.g. "APPROVED, but rename X") is an objection, so isn't an approval.
+    """
+    return re.fullmatch(rf"\s*{CRITIC_APPROVAL}[\s.!]*", feedback) is not None
+
+
+async def run_agent_cached(agent: Agent, state: BaseModel) -> Any:
+    """ Runs the agent on the given input state and returns the response content, serving it from the response cache where possible. """
+    key = hashlib.sha256(json.dumps(
+        {"agent": agent.name, "model": agent.model.id, "input": state.model_dump(mode="json")}, 
+        sort_keys=True
+    ).encode()).hexdigest()
+
+    cached = _response_cache.get(key)
+    if cached is not None and cached[0] > time.monotonic():
+        return cached[1]
+
+    content = (await agent.arun(state)).content
+
+    if len(_response_cache) >= RESPONSE_CACHE_MAX_ENTRIES: # Evict oldest entry
+        _response_cache.pop(next(iter(_response_cache)))
+    _response_cache[key] = (time.monotonic() + RESPONSE_CACHE_TTL_SECONDS, content)
+    return content
+
+
+async def create_instruction_cache(model: Gemini, instructions: str) -> str | None:
+    """ Creates a Gemini context cache holding the given instructions for the model, returning its name - or None (logging why) if it can't be created """
+    try:
+        # Created with the model's own client, so it uses the same credentials & backend (API key or Vertex AI) as the agent's requests
+        cache = await model.get_client().aio.caches.create(
+            model=model.id,
+            config=types.CreateCachedContentConfig(system_instruction=instructions, ttl=f"{INSTRUCTION_CACHE_TTL_SECONDS}s"),
+        )
+    except Exception as e: # Caching is only an optimization, so any failure (instructions below the min cacheable token count, missing credentials, network errors...) falls back to inline instructions
+        logger.warning(f"Could not cache instructions for {model.id}, sending them inline: {e}")
+        return None
+    return cache.name
+
+
+async def get_instruction_cache(model: Gemini, instructions: str) -> str | None:
+    """
+    Returns the name of a live context cache holding the given instructions for the model, creating one on first use or once expired - or None if one can't be created.
+    Concurrent callers for the same model & instructions share a single creation request.
+    """
+    key = (model.id, hashlib.sha256(instructions.encode()).hexdigest())
+    entry = _instruction_caches.get(key)
+    # A pending creation task can only be awaited from its own event loop (Flask runs each async request in a new one), 
+    # and a cancelled one (e.g. its loop was closed mid-creation) never produces a cache
+    if (entry is None or entry[0] <= time.monotonic() or entry[1].cancelled() 
+            or (not entry[1].done() and entry[1].get_loop() is not asyncio.get_running_loop())):
+        # Expire a little before the TTL lapses, so a cache never expires mid-request
+        entry = (time.monotonic() + INSTRUCTION_CACHE_TTL_SECONDS - 60, asyncio.ensure_future(create_instruction_cache(model, instructions)))
+        _instruction_caches[key] = entry
+    # Shielded, so a cancelled caller doesn't cancel the creation shared with the other callers
+    return await asyncio.shield(entry[1])
+
+
+def _heuristic_schema(file_samples: Dict[str, FileSample], likely_unique_ids: Dict[str, List[str]]) -> StructuredSchema:
+    """
+    Drafts a schema by applying the mechanical parts of the schema design rules (see the proposal agent's instructions) locally, 
+    to seed the proposal agent's first proposal so it refines a draft rather than inventing one:
+        - a file whose name is a single thing, with a unique identifier, becomes a node; its other "_id" columns become reference relationships
+        - a file with no unique identifier but 2+ "_id" columns becomes a full relationship between the referenced nodes
+    Files matching neither rule are left for the proposal agent.
+    """
+    def words(name: str) -> List[str]: # Splits a filename/column name on "_", "-", spaces & camelCase
+        return re.findall(r"[A-Z]?[a-z0-9]+|[A-Z]+(?![a-z])", name.rsplit(".", 1)[0])
+
+    def singular(word: str) -> str: # Naive English singularization, enough for typical filenames (e.g. categories, addresses, boxes, status)
+        word = word.lower()
+        if word.endswith("ies"):
+            return word[:-3] + "y"
+        if word.endswith(("sses", "xes", "ches", "shes")):
+            return word[:-2]
+        if word.endswith(("ss", "us", "is")):
+            return word
+        return word.removesuffix("s")
+
+    def label(name_words: List[str]) -> str: # e.g. ["order", "items"] -> "ORDER_ITEM"
+        return "_".join([*name_words[:-1], singular(name_words[-1])]).upper() if name_words else ""
+
+    def id_columns(sample: FileSample) -> List[str]:
+        return [c for c in sample.columns if words(c) and words(c)[-1].lower() == "id"]
+    
+    entity_types: Dict[str, EntityType] = {}
+    references: List[Tuple[str, str, List[str]]] = [] # (source label, relationship label, target words), resolved once all nodes are known
+    for filename, sample in file_samples.items():
+        name_words, unique_ids, fk_columns = words(filename), likely_unique_ids.get(filename, []), id_columns(sample)
+
+        if len(name_words) == 1 and unique_ids:
+            node = label(name_words)
+            # Foreign keys are expressed as relationships, so are omitted from the node's fields
+            foreign_keys = [c for c in fk_columns if c not in unique_ids]
+            entity_types[node] = EntityType(label=node, fields=[c for c in sample.columns if c not in foreign_keys])
+            for column in foreign_keys:
+                target_words = words(column)[:-1]
+                references.append((node, f"HAS_{label(target_words)}", target_words))
+
+        elif not unique_ids and len(fk_columns) >= 2:
+            source, target = (words(c)[:-1] for c in fk_columns[:2])
+            references.append((label(source), label(name_words), target))
+
+    relationship_types = [
+        RelationshipType(label=relationship, source=source, target=label(target_words))
+        for source, relationship, target_words in references
+        # Only keep relationships between drafted nodes - the rest need the proposal agent's judgement
+        if source in entity_types and label(target_words) in entity_types
+    ]
+    return StructuredSchema(entity_types=list(entity_types.values()), relationship_types=relationship_types)
 
 
 class SchemaCriticLoop():
@@ -24,6 +255,9 @@ class SchemaCriticLoop():
         loop - the underlying agno workflow Loop object
         proposal_agent - the schema proposal agent used in the propose-schema step
         critic_agent - the schema critic agent used in the critique-schema step
+        instructions - each agent's static instructions, mapped by agent name. Kept here as they're moved out of the agents into Gemini context caches (see cache_instructions).
+        critiques - the critic agent's feedback on each schema it has reviewed, mapped by the schema's canonical key. 
+            Lets an equivalent re-proposed schema (same entities & relationships, possibly reordered) reuse its verdict without another critic call.
         last_iteration_output_content - stores the output content of the final step of the last iteration, so as to have state persist across iterations.
             NOTE: Agno does not pass the output of the last step as an input to the first step of the next iteration, so we have to do this manually by capturing it here.
     """
@@ -31,25 +265,39 @@ class SchemaCriticLoop():
     loop: Loop
     proposal_agent: Agent
     critic_agent: Agent
+    instructions: Dict[str, str]
+    critiques: Dict[str, str]
     last_iteration_output_content: "SchemaCriticLoop.LoopState | None" = None
 
     
     class LoopState(BaseModel):
         """
         A state object that gets passed as input & output content of the steps in the loop.
-        It's passed as input to both the proposal agent and the critic agent.
+        It's passed as input to the proposal agent (the critic agent gets a trimmed CriticInput instead).
         This is internal to the schema proposal loop and thus separate from the overall workflow session state.
         """
 
-        # STATIC FIELDS - not to change after being set
-        file_samples: Dict[str, List[str]] = Field(description="The first 11 rows of the provided CSV files (1st row being column headers). Provided as a dict mapping the filename to a list of rows.")
-        user_goal: UserGoal = Field(description="The user's objective in making a knowledge graph")
+        # STATIC FIELDS - not to change after being set. Frozen, so states are built from one another with model_copy, sharing these rather than copying & revalidating them.
+        file_samples: Dict[str, FileSample] = Field(frozen=True, description="Samples of the provided CSV files - their column headers and first 10 rows. Provided as a dict mapping the filename to its sample.")
+        likely_unique_ids: Dict[str, List[str]] = Field(frozen=True, description="The columns of each CSV file whose values are unique across the whole file (i.e. candidate unique identifiers), as a dict mapping the filename to a list of column names.")
+        user_goal: UserGoal = Field(frozen=True, description="The user's objective in making a knowledge graph")
 
         # DYNAMIC FIELDS - to be updated by the steps in the loop
         proposed_schema: StructuredSchema | None = Field(default=None, description="The proposed schema from the proposal agent")
         critic_feedback: str = Field(default="", description="Feedback from the critic agent")
 
 
+    class CriticInput(BaseModel):
+        """
+        Input to the critic agent - the parts of the LoopState relevant to reviewing the proposed schema.
+        Carries only each file's column headers & unique identifier candidates rather than full file samples, which cuts the input tokens of every critic call.
+        """
+        user_goal: UserGoal = Field(description="The user's objective in making a knowledge graph")
+        file_headers: Dict[str, List[str]] = Field(description="The column headers of the provided CSV files, as a dict mapping the filename to its list of column headers")
+        likely_unique_ids: Dict[str, List[str]] = Field(description="The columns of each CSV file whose values are unique across the whole file (i.e. candidate unique identifiers), as a dict mapping the filename to a list of column names.")
+        proposed_schema: StructuredSchema = Field(description="The proposed schema from the proposal agent")
+
+
     def __init__(self, max_iterations: int = 10) -> None:
 
         self.proposal_agent = Agent(
@@ -57,134 +305,21 @@ class SchemaCriticLoop():
             model=Gemini(id="gemini-2.5-flash-lite"),
             input_schema=self.LoopState,
             output_schema=StructuredSchema,
-            instructions=dedent(f"""
-            You are an expert at knowledge graph schema design. Your task is to propose a schema for a knowledge graph that can fulfill a provided user goal. 
-            The knowledge graph will be created from some CSV files. The first 11 rows of each file (the first row being column headings) will be provided to you. Use them to ascertain a schema that fulfills the user goal.
-            You'll also be given feedback from a critic agent on a previous proposed schema. Use this to refine the schema.
-
-            A knowledge graph schema consists of 2 lists:
-            - a list of entity types (nodes) (e.g. Person, Company, Product). These have fields/attributes (e.g. for Person, fields could be name, age, address).
-            - a list of relationship types (edges). Each relationship type is represented by 3 components: SOURCE_ENTITY_TYPE, RELATIONSHIP_TYPE, DESTINATION_ENTITY_TYPE;
-                thus specifying the concerned entity types as well as the nature of the relationship itself. e.g. [Person, WORKS_AT, Company], [Product, MANUFACTURED_BY, Company].
-                Relationships do not have their own fields/attribute lists.
-                
-            Note that you are not being asked to extract instances of entities (e.g Joe, Mark, Devin) or relationships (e.g. Joe likes Mark), just the high-level entity types and relationship types.
-
-            # SCHEMA RULES & GUIDANCE
-            Every file in the approved files list will become either a node or a relationship. Determining whether a file likely represents a node or a relationship is based on a hint from the filename
-            (is it a single thing or two things) and the identifiers found within the file. Because unique identifiers are so important for determining the structure of the graph, 
-            always verify the uniqueness of suspected unique identifiers by examining the file samples.
-
-            The resulting schema should be a connected graph, with no isolated components.
-
-            ## General guidance for identifying a node or a relationship
-            - If the file name is singular and has only 1 unique identifier it is likely a node
-            - If the file name is a combination of two things, it is likely a full relationship
-            - If the file name sounds like a node, but there are multiple unique identifiers, that is likely a node with some relationships to other nodes.
-
-            ## Design rules for nodes
-            - Nodes will have unique identifiers.
-            - Nodes _may_ have "foreign key" identifiers that indicate relationships.
-
-            ## Design rules for relationships
-
-            Relationships appear in two ways: full relationships and reference relationships.
-
-            ### Full relationships
-            - Full relationships appear in dedicated relationship files, often having a filename that references two entities
-            - These represent many-to-many relationships.
-            - Full relationships typically have foreign key references to a source and destination entity.
-            - Full relationships _do not have_ unique identifiers, but instead have references to the primary keys of the source and destination nodes.
-            - The absence of a single, unique identifier is a strong indicator that a file is a full relationship.
-
-            ### Reference relationships
-            - Reference relationships appear as foreign key references in node files
-            - These represent one-to-one or many-to-one relationships.
-            - Reference relationship foreign key column names often hint at the destination node and relationship type
-            - References may be hierarchical container relationships, with terminology revealing parent-child, "has", "contains", membership, or similar relationship
-            - References may be peer relationships, that is often a self-reference to a similar class of nodes. For example, "knows" or "see also"
-                            
-            ### Relationship or Entity?
-            For full, many-to-many relationships, it sometimes makes sense to have that "relationship" exist in the schema as an entity in and of itself.
-            This is the case when the "relationship" has properties/fields of it's own. e.g. relationship PURCHASED between USER and PRODUCT might have fields (DATE, PAYMENT_METHOD etc.) so
-            may be best off as it's own entity, with relationships tying it to the USER and the PRODUCTS.
-
-            ## ADDITIONAL POINTS
-            - This is a graph database, not a relational database schema. Entities should be connected solely through relationships, not through foreign key reference fields. Thus any foreign key fields in the CSV files should be omitted from the graph database schema.
-            - For any entity type, assume that the "<entity>_id" field is the unique identifier field.
-            """),
+            instructions=_PROPOSAL_INSTRUCTIONS,
             debug_mode=True,
         )
 
         self.critic_agent = Agent(
             name="critic-agent",
             model=Gemini(id="gemini-2.5-flash-lite"),
-            input_schema=self.LoopState,
-            instructions=dedent(f"""
-            You are an expert at knowledge graph schema design. Your task is to critique the proposed knowledge graph schema put forth by a proposal agent.
-            
-            A knowledge graph schema consists of 2 lists:
-            - a list of entity types (nodes) (e.g. Person, Company, Product). These have fields/attributes (e.g. for Person, fields could be name, age, address).
-            - a list of relationship types (edges). Each relationship type is represented by 3 components: SOURCE_ENTITY_TYPE, RELATIONSHIP_TYPE, DESTINATION_ENTITY_TYPE;
-                thus specifying the concerned entity types as well as the nature of the relationship itself. e.g. [Person, WORKS_AT, Company], [Product, MANUFACTURED_BY, Company].
-                Relationships do not have their own fields/attribute lists.
-
-            The proposed schema should be evaulated against the user goal (provided as an input) to determine it's alignment with the user's objective.
-            The knowledge graph will be created from some CSV files. The first 11 rows of each file (the first row being column headings) will be provided to you, 
-            so you can test the accuracy of the proposed schema.
-
-            Based on the proposed entity types and relationship types, provide feedback on their relevance to the user's objective and their completeness.
-            If you believe the proposed schema is (sufficiently) appropriate and complete, respond with only the word "APPROVED".
-
-            When providing feedback, aim to be concise and specific: clearly mention any suggested changes, and do not provide generic feedback.
-            Do not provide any positive/affirmative feedback - only suggest changes or state "APPROVED".
-            
-            # SCHEMA RULES & GUIDANCE
-            Every file in the approved files list will become either a node or a relationship. Determining whether a file likely represents a node or a relationship is based on a hint from the filename
-            (is it a single thing or two things) and the identifiers found within the file. Because unique identifiers are so important for determining the structure of the graph, 
-            always verify the uniqueness of suspected unique identifiers by examining the file samples.
-
-            The resulting schema should be a connected graph, with no isolated components.
-
-            ## General guidance for identifying a node or a relationship
-            - If the file name is singular and has only 1 unique identifier it is likely a node
-            - If the file name is a combination of two things, it is likely a full relationship
-            - If the file name sounds like a node, but there are multiple unique identifiers, that is likely a node with some relationships to other nodes.
-
-            ## Design rules for nodes
-            - Nodes will have unique identifiers.
-            - Nodes _may_ have "foreign key" identifiers that indicate relationships.
-
-            ## Design rules for relationships
-
-            Relationships appear in two ways: full relationships and reference relationships.
-
-            ### Full relationships
-            - Full relationships appear in dedicated relationship files, often having a filename that references two entities
-            - These represent many-to-many relationships.
-            - Full relationships typically have foreign key references to a source and destination entity.
-            - Full relationships _do not have_ unique identifiers, but instead have references to the primary keys of the source and destination nodes.
-            - The absence of a single, unique identifier is a strong indicator that a file is a full relationship.
-
-            ### Reference relationships
-            - Reference relationships appear as foreign key references in node files
-            - These represent one-to-one or many-to-one relationships.
-            - Reference relationship foreign key column names often hint at the destination node and relationship type
-            - References may be hierarchical container relationships, with terminology revealing parent-child, "has", "contains", membership, or similar relationship
-            - References may be peer relationships, that is often a self-reference to a similar class of nodes. For example, "knows" or "see also"
-                                
-            ### Relationship or Entity?
-            For full, many-to-many relationships, it sometimes makes sense to have that "relationship" exist in the schema as an entity in and of itself.
-            This is the case when the "relationship" has properties/fields of it's own. e.g. relationship PURCHASED between USER and PRODUCT might have fields (DATE, PAYMENT_METHOD etc.) so
-            may be best off as it's own entity, with relationships tying it to the USER and the PRODUCTS.
-
-            ## ADDITIONAL POINTS
-            - This is a graph database, not a relational database schema. Entities should be connected solely through relationships, not through foreign key reference fields. Thus any foreign key fields in the CSV files should be omitted from the graph database schema.
-            - For any entity type, assume that the "<entity>_id" field is the unique identifier field.
-            """),
+            input_schema=self.CriticInput,
+            instructions=_CRITIC_INSTRUCTIONS,
             debug_mode=True
         )
 
+        self.instructions = {agent.name: agent.instructions for agent in (self.proposal_agent, self.critic_agent)}
+        self.critiques = {}
+
         self.loop = Loop(
             name='schema-critic-loop',
             max_iterations=max_iterations,
@@ -192,53 +327,153 @@ class SchemaCriticLoop():
                 Step(name='propose-schema', executor=self.propose_schema),
                 Step(name='critique-schema', executor=self.critique_schema)
             ],
-            end_condition=( lambda step_outputs: step_outputs[-1].critic_feedback == "APPROVED" ), # End loop if critic agent approves
+            end_condition=( lambda step_outputs: step_outputs[-1].content.critic_feedback == CRITIC_APPROVAL ), # End loop if critic agent approves
         )
 
+    async def cache_instructions(self) -> None:
+        """
+        Moves each agent's static instructions into a Gemini context cache (see get_instruction_cache), so they aren't re-sent (and billed) 
+        as fresh input tokens on every call; the agents then reference the cache instead.
+        If a cache can't be created, that agent keeps sending its instructions inline.
+        """
+        for agent in (self.proposal_agent, self.critic_agent):
+            cache_name = await get_instruction_cache(agent.model, self.instructions[agent.name])
+            # Gemini rejects requests that set a system instruction alongside cached content
+            agent.model.cached_content, agent.instructions = cache_name, (None if cache_name else self.instructions[agent.name])
+
+
     async def propose_schema(self, step_input: StepInput, session_state) -> StepOutput:
         """ LOOP STEP 1: Proposes a schema based on the provided CSV files."""
+        await self.cache_instructions()
 
-        if self.last_iteration_output_content is None: # If this is the first iteration of loop - create LoopState de novo
+        if self.last_iteration_output_content is None: # If this is the first iteration of loop, create LoopState de novo
+            file_samples = {filename: file.sample() for filename, file in session_state['files'].items()} # Get file samples from session state files 
+            # Uniqueness is checked locally over the full files, sparing the agent from reasoning about it from samples
+            likely_unique_ids = {filename: file.unique_columns() for filename, file in session_state['files'].items()}
             state = SchemaCriticLoop.LoopState(
                 user_goal = session_state['user_goal'],
-                file_samples = {filename: file.sample() for filename, file in session_state['files'].items()} # Get file samples from session state files 
+                file_samples = file_samples,
+                likely_unique_ids = likely_unique_ids,
+                proposed_schema = _heuristic_schema(file_samples, likely_unique_ids) # Seed the first proposal with a rule-based draft
             )
         else:
             # First step in loop, so input is output of last step of previous iteration
             state: SchemaCriticLoop.LoopState = self.last_iteration_output_content 
 
-        response = await self.proposal_agent.arun(state)
+        if not state.critic_feedback and len(state.file_samples) > SHARDED_PROPOSAL_FILE_THRESHOLD: # No feedback yet, so this is the first proposal
+            proposed_schema = await self.propose_sharded_schema(state)
+        else:
+            proposed_schema: StructuredSchema = (await self.proposal_agent.arun(state)).content
+            # Drop duplicate entity/relationship types the agent may emit (e.g. "PERSON" & "Person"), so they don't bloat later prompts
+            proposed_schema = StructuredSchema.merge([proposed_schema])
 
         with open("/Users/devinsidhu/Documents/RAG_graph_constructor/src/tests/log.txt", "a") as f:
-            f.write(f"{response.content.model_dump_json(indent=2)}\n\n --------------------------------------------------------------\n\n")
+            f.write(f"{proposed_schema.model_dump_json(indent=2)}\n\n --------------------------------------------------------------\n\n")
 
         return StepOutput(
-            content=self.LoopState(
-                file_samples=state.file_samples,
-                user_goal=state.user_goal,
-                proposed_schema=response.content,
-                # Reset critic feedback to default empty str
-            )
+            content=state.model_copy(update={
+                "proposed_schema": proposed_schema,
+                "critic_feedback": "", # Reset critic feedback to default empty str
+            })
         )
     
+    async def propose_sharded_schema(self, state: "SchemaCriticLoop.LoopState") -> StructuredSchema:
+        """
+        Drafts a schema by splitting the files (round-robin, by filename) into PROPOSAL_SHARDS groups, 
+        running the proposal agent on each group concurrently, then merging the resulting schemas.
+        Only used for the first proposal over many files - the proposal agent then refines the merged draft against all files in later iterations, 
+        so relationships spanning shards can still be found.
+        """
+        shards: List[List[str]] = [[] for _ in range(PROPOSAL_SHARDS)]
+        for i, filename in enumerate(sorted(state.file_samples)):
+            shards[i % PROPOSAL_SHARDS].append(filename)
+
+        shard_states = []
+        for shard in shards:
+            file_samples = {filename: state.file_samples[filename] for filename in shard}
+            likely_unique_ids = {filename: state.likely_unique_ids[filename] for filename in shard}
+            shard_states.append(self.LoopState(
+                file_samples=file_samples, 
+                likely_unique_ids=likely_unique_ids,
+                user_goal=state.user_goal,
+                proposed_schema=_heuristic_schema(file_samples, likely_unique_ids),
+            ))
+
+        responses = await asyncio.gather(*[self.proposal_agent.arun(shard_state) for shard_state in shard_states])
+        schemas = [response.content for response in responses]
+        return StructuredSchema.merge(schemas)
+    
     async def critique_schema(self, step_input: StepInput) -> StepOutput:
-        """ LOOP STEP 2: Critiques the proposed schema by the proposal agent."""
+        """ 
+        LOOP STEP 2: Critiques the proposed schema by the proposal agent.
+        If an equivalent schema was critiqued before, its feedback is reused: an approval ends the loop straight away, and a repeated rejection 
+        hands the proposal agent the same feedback again rather than spending a critic call on an oscillating proposal - 
+        flagged as a repeat, so the proposal agent's next input differs from the one that produced the repeated schema.
+        """
         state: SchemaCriticLoop.LoopState = step_input.get_step_output('propose-schema').content
-        response = await self.critic_agent.arun(state)
-        feedback: str = response.content
+
+        # Reuse the verdict on an equivalent schema if the critic has already reviewed one
+        schema_key = state.proposed_schema.canonical_key()
+        feedback = self.critiques.get(schema_key)
+        if feedback is None:
+            # Critic gets only the files' column headers & unique identifier candidates, not full samples, as it reviews the schema's structure rather than the data
+            critic_input = self.CriticInput(
+                user_goal=state.user_goal,
+                file_headers={filename: sample.columns for filename, sample in state.file_samples.items()},
+                likely_unique_ids=state.likely_unique_ids,
+                proposed_schema=state.proposed_schema,
+            )
+            feedback = await run_agent_cached(self.critic_agent, critic_input)
+            feedback = CRITIC_APPROVAL if is_approval(feedback) else feedback.strip()
+            self.critiques[schema_key] = feedback
+        elif feedback != CRITIC_APPROVAL:
+            feedback = f"You have already proposed this schema, and it was rejected for the following reasons. Propose a different schema that addresses them.\n{feedback}"
 
         with open("/Users/devinsidhu/Documents/RAG_graph_constructor/src/tests/log.txt", "a") as f:
             f.write(f"{feedback}\n\n --------------------------------------------------------------\n\n")
 
-        output_state = self.LoopState(
-            file_samples=state.file_samples,
-            user_goal=state.user_goal,
-            proposed_schema=state.proposed_schema,
-            critic_feedback=feedback
-        )
+        output_state = state.model_copy(update={"critic_feedback": feedback})
         self.last_iteration_output_content = output_state # Last step in loop, so store output content for next iteration
         return StepOutput(content=output_state)
 
+    @classmethod
+    async def run_batch(cls, configs: List[Dict[str, Any]], concurrency: int = 8, max_iterations: int = 10) -> List[StructuredSchema | None]:
+        """
+        Runs the loop standalone over many sets of inputs concurrently - e.g. for generating schemas over a dataset of CSV bundles.
+        Each run gets its own loop instance & workflow session state, and at most `concurrency` runs are in flight at once, 
+        so independent Gemini round-trips overlap without exceeding API rate limits.
+        Args:
+            configs - one dict per run, with keys "files" (CSV files, mapped by filename) and "user_goal"
+            concurrency - maximum number of runs in progress at once
+            max_iterations - max iterations of each run's loop
+        Returns:
+            The critic-approved schema of each run, in the order of configs - or None for a run that hit max_iterations without the critic approving a schema
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def run(files: Dict[str, CSVFile], user_goal: UserGoal) -> StructuredSchema | None:
+            async with semaphore:
+                critic_loop = cls(max_iterations=max_iterations)
+                workflow = Workflow(
+                    name='schema-critic-batch-workflow',
+                    session_state={"files": files, "user_goal": user_goal},
+                    steps=[critic_loop.get_loop()],
+                )
+                await workflow.arun(input=user_goal.description)
+                final_state = critic_loop.last_iteration_output_content
+                if final_state is None or final_state.critic_feedback != CRITIC_APPROVAL:
+                    return None
+                return final_state.proposed_schema
+
+        return await asyncio.gather(*[run(config["files"], config["user_goal"]) for config in configs])
+
+    def reset(self) -> None:
+        """ 
+        Clears the state carried between iterations, so the next run of the loop starts afresh rather than continuing the previous run.
+        Instruction caches & past critiques are kept, as they don't depend on the run.
+        """
+        self.last_iteration_output_content = None
+
     def get_loop(self) -> Loop:
         """ returns the underlying loop - for adding loop to a workflow """
         return self.loop
@@ -2,9 +2,9 @@ from typing import List
 from pydantic import BaseModel, Field
 from agno.workflow import  Loop, Step, StepInput, StepOutput
 
-from src.common import UserGoal
-from src.common.structured import CSVFile
-from src.common.message import Message, get_latest_user_message
+from ...common import UserGoal
+from ...common.structured import CSVFile
+from ...common.message import Message, get_latest_user_message
 
 from .schema_critic_loop import SchemaCriticLoop
 
@@ -28,11 +28,13 @@ class SchemaProposalLoop():
     
     Attributes:
         loop - the underlying agno workflow Loop object
+        critic_loop - the nested schema critic loop, built once and reset (rather than rebuilt) between iterations
         last_iteration_output_content - stores the output content of the final step of the last iteration, so as to have state persist across iterations.
             NOTE: Agno does not pass the output of the last step as an input to the first step of the next iteration, so we have to do this manually by capturing it here.
     """
 
     loop: Loop
+    critic_loop: SchemaCriticLoop
     last_iteration_output_content: "SchemaProposalLoop.LoopState | None" = None  
 
 
@@ -72,14 +74,16 @@ class SchemaProposalLoop():
     def __init__(self, 
         files: List[CSVFile],
         user_goal: UserGoal,
-        max_iterations: int = 10) -> None:
+        max_iterations: int = 10,
+        critic_max_iterations: int = 10) -> None:
 
+        self.critic_loop = SchemaCriticLoop(max_iterations=critic_max_iterations)
         self.loop = Loop(
             name='schema-proposal-loop',
             max_iterations=max_iterations,
             steps=[
                 Step(name='get-user-input', executor=self.get_user_input),
-                SchemaCriticLoop().get_loop()
+                self.critic_loop.get_loop()
             ],
             end_condition= ( lambda step_outputs: step_outputs[-1].content.approved ), # End loop if schema is marked approved
         )
@@ -108,10 +112,11 @@ class SchemaProposalLoop():
             )
 
         # Subsequent iterations - get latest user message from flask app
+        self.critic_loop.reset() # Critic loop is reused across iterations, so clear its state from the previous run
         user_msg: Message = await get_latest_user_message()
         return StepOutput(
             content=self.LoopState(
-                chat_history=state.chat_history+[user_msg], # Add latest user message to chat history
+                chat_history=[*state.chat_history, user_msg], # Add latest user message to chat history - in a new list, as earlier step outputs hold the old one
                 entity_types=state.entity_types,
                 relationship_types=state.relationship_types,
             )
@@ -1,5 +1,5 @@
 from typing_extensions import List
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, TypeAdapter
 from textwrap import dedent
 from agno.workflow import  Loop, Step, StepInput, StepOutput
 from agno.agent import Agent
@@ -8,6 +8,24 @@ from agno.models.google.gemini import Gemini
 from ..common.message import Message, get_latest_user_message, write_agent_message_to_session
 from ..common import UserGoal
 
+# Validates messages entering the loop from outside - the loop's states are built with model_construct, which doesn't validate them
+_MESSAGE_ADAPTER = TypeAdapter(Message)
+
+# Dedented once at import rather than on every agent construction
+_USER_INTENT_INSTRUCTIONS = dedent("""
+    You are an expert at knowledge graph use cases. Your objective is to ascertain the user's goal for the knowledge graph they wish to create.
+
+    A user goal has 2 components:  
+        - kind_of_graph: at most 3 words stating the graph's purpose, for example "social network" or "USA freight logistics"  
+        - description: at most 3 short sentences about the intention of the graph, for example "A dynamic routing and delivery system for cargo." or "Analysis of product dependencies and supplier alternatives
+
+    Ascertain the user's percieved goal from their previous messages (in the chat history) and the currently assumed user goal (if there is one), 
+    then present the new perceived user goal to the user for confirmation, asking clarifying questions if you need to.
+    If the user agrees with the proposed user goal: set goal_approved to True in your output
+    If you can't derive a user goal from the user's message, leave the user goal as None. Do not allow the user to approve a user goal with value None.
+    """)
+
+
 class UserIntentLoop():
     """
     Wrapper class for a user intent elicitation loop within a workflow.
@@ -19,16 +37,19 @@ class UserIntentLoop():
     If the user agrees with the goal proposal by inputting some message of approval, the agent in propose-user-goal marks the proposed goal as approved, 
     and the approved user goal is added to the top-level knowledge workflow's session state.
     
+    The output content of the final step of each iteration is stored in the workflow session state (under LAST_OUTPUT_KEY), so as to have state persist across iterations.
+        NOTE: Agno does not pass the output of the last step as an input to the first step of the next iteration, so we have to do this manually.
+        Keeping it in session state rather than on this object keeps it scoped to the workflow session, so a loop instance never sees another session's state.
+    
     Attributes:
         loop - the underlying agno workflow Loop object
         agent - the user intent agent used in the propose-user-goal step
-        last_iteration_output_content - stores the output content of the final step of the last iteration, so as to have state persist across iterations.
-            NOTE: Agno does not pass the output of the last step as an input to the first step of the next iteration, so we have to do this manually by capturing it here.
     """
 
     loop: Loop
     agent: Agent
-    last_iteration_output_content: "UserIntentLoop.LoopState | None" = None  
+
+    LAST_OUTPUT_KEY = "user_intent_last_output" # Session state key for the output content of the last iteration's final step
 
 
     class AgentOutputSchema(BaseModel):
@@ -49,6 +70,8 @@ class UserIntentLoop():
         """
         A state object that gets passed as input & output content of the steps in the loop
         This is internal to the user intent loop and thus separate from the overall workflow session state.
+        The steps build it with model_construct, which skips validation (and agno passes LoopState instances to the agent as-is, unvalidated).
+        So user messages are validated where they enter the loop, in get-user-input; the other fields come from the previous state or the agent's (already validated) output.
     
         Attributes:
             chat_history - The chat history so far between the user and the user intent agent, as a list of messages.
@@ -67,18 +90,7 @@ class UserIntentLoop():
             model=Gemini(id="gemini-2.5-flash-lite"),
             input_schema=self.LoopState,
             output_schema=self.AgentOutputSchema,
-            instructions=dedent("""
-            You are an expert at knowledge graph use cases. Your objective is to ascertain the user's goal for the knowledge graph they wish to create.
-
-            A user goal has 2 components:  
-                - kind_of_graph: at most 3 words stating the graph's purpose, for example "social network" or "USA freight logistics"  
-                - description: at most 3 short sentences about the intention of the graph, for example "A dynamic routing and delivery system for cargo." or "Analysis of product dependencies and supplier alternatives
-
-            Ascertain the user's percieved goal from their previous messages (in the chat history) and the currently assumed user goal (if there is one), 
-            then present the new perceived user goal to the user for confirmation, asking clarifying questions if you need to.
-            If the user agrees with the proposed user goal: set goal_approved to True in your output
-            If you can't derive a user goal from the user's message, leave the user goal as None. Do not allow the user to approve a user goal with value None.
-            """),
+            instructions=_USER_INTENT_INSTRUCTIONS,
             markdown=True,
             debug_mode=True
         )
@@ -94,28 +106,28 @@ class UserIntentLoop():
         )
 
 
-    async def get_user_input(self, step_input: StepInput) -> StepOutput:
+    async def get_user_input(self, step_input: StepInput, session_state) -> StepOutput:
         """
         LOOP STEP 1: retrieving user input from the flask app. 
         If this is the the loop's first iteration, we just get the user's initial input message and pass it to the next step.
         If not, we wait for the user to send a message in the flask app, and pass that on.
         """
 
-        state = self.last_iteration_output_content # First step in loop, so input is output of last step of last iteration
+        state = session_state.get(self.LAST_OUTPUT_KEY) # First step in loop, so input is output of last step of last iteration
         if state is None: # If loop's first iteration - pass initial user input straight to next step
             return StepOutput(
-                content=self.LoopState(
-                    chat_history=[Message( # Add initial user message as start of chat history
-                        sender='user', 
-                        content=step_input.input 
-                    )]
+                content=self.LoopState.model_construct(
+                    chat_history=[_MESSAGE_ADAPTER.validate_python({ # Add initial user message as start of chat history
+                        'sender': 'user', 
+                        'content': step_input.input 
+                    })]
                 )
             )
 
-        user_msg: Message = await get_latest_user_message()
+        user_msg: Message = _MESSAGE_ADAPTER.validate_python(await get_latest_user_message())
         return StepOutput(
-            content=self.LoopState(
-                chat_history=state.chat_history+[user_msg], # Add latest user message to chat history
+            content=self.LoopState.model_construct(
+                chat_history=[*state.chat_history, user_msg], # Add latest user message to chat history - in a new list, as earlier step outputs hold the old one
                 proposed_goal=state.proposed_goal, 
             )
         )
@@ -130,32 +142,41 @@ class UserIntentLoop():
         or refine the previously proposed goal if there was one, based on the user's feedback.
 
         If the user agrees with the goal proposal, the approved user goal is added to the workflow's session state.
+        If the user's latest message is empty (or only whitespace), the agent isn't called; the user is just asked for more detail.
         """
 
         state : "UserIntentLoop.LoopState" = step_input.get_step_output('get-user-input').content
-        response : "UserIntentLoop.AgentOutputSchema" = await self.agent.arun(state)
+
+        latest_user_input = (state.chat_history[-1]['content'] or "") if state.chat_history else ""
+        if not latest_user_input.strip():
+            # Nothing to derive a goal from - ask for more without spending an LLM call. Short replies (e.g. "ok", "y") still go to the agent, as they may be approvals
+            agent_message = "Could you tell me a bit more about what you'd like your knowledge graph to be used for?"
+            proposed_goal, goal_approved = state.proposed_goal, False
+        else:
+            response : "UserIntentLoop.AgentOutputSchema" = await self.agent.arun(state)
+            agent_message = response.content.llm_message
+            proposed_goal, goal_approved = response.content.proposed_goal, response.content.goal_approved
 
         # Write agent's output - deterministically format proposed user goal
-        agent_message = response.content.llm_message
-        if response.content.proposed_goal:
+        if proposed_goal:
             agent_message += "\n\n" + f"""
-            **{"Finalized" if response.content.goal_approved else "Proposed"} User Goal: **\n
-            \tkind of graph: {response.content.proposed_goal.kind_of_graph}\n
-            \tdescription: {response.content.proposed_goal.description}
+            **{"Finalized" if goal_approved else "Proposed"} User Goal: **\n
+            \tkind of graph: {proposed_goal.kind_of_graph}\n
+            \tdescription: {proposed_goal.description}
             """
         write_agent_message_to_session(agent_message)
 
         # If goal approved, Update workflow session state with approved goal
-        if response.content.goal_approved:
-            session_state["user_goal"] = UserGoal(kind_of_graph=response.content.proposed_goal.kind_of_graph, description=response.content.proposed_goal.description)
+        if goal_approved:
+            session_state["user_goal"] = UserGoal(kind_of_graph=proposed_goal.kind_of_graph, description=proposed_goal.description)
 
         # This is last step in iteration, so capture step output for next iteration
-        output = self.LoopState(
-            chat_history=state.chat_history + [Message(sender='agent', content=agent_message)],
-            proposed_goal=response.content.proposed_goal,
-            goal_approved=response.content.goal_approved
+        output = self.LoopState.model_construct(
+            chat_history=[*state.chat_history, Message(sender='agent', content=agent_message)], # New list, so earlier step outputs keep their history
+            proposed_goal=proposed_goal,
+            goal_approved=goal_approved
         )
-        self.last_iteration_output_content = output  
+        session_state[self.LAST_OUTPUT_KEY] = output
 
         return StepOutput(content=output)
     
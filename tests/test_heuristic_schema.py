@@ -0,0 +1,61 @@
+import unittest
+
+from src.common.structured import FileSample
+from src.workflow.structured.schema_critic_loop import _heuristic_schema
+
+
+def sample(*columns: str) -> FileSample:
+    return FileSample(columns=list(columns), rows=[])
+
+
+class TestHeuristicSchema(unittest.TestCase):
+
+    def test_plural_filenames_are_singularized_to_match_foreign_keys(self):
+        schema = _heuristic_schema(
+            {
+                "customers.csv": sample("customer_id", "name", "address_id"),
+                "addresses.csv": sample("address_id", "street"),
+                "products.csv": sample("product_id", "title", "category_id", "status_id"),
+                "categories.csv": sample("category_id", "name"),
+                "status.csv": sample("status_id", "name"),
+                "boxes.csv": sample("box_id", "size"),
+            },
+            {
+                "customers.csv": ["customer_id"],
+                "addresses.csv": ["address_id"],
+                "products.csv": ["product_id"],
+                "categories.csv": ["category_id"],
+                "status.csv": ["status_id"],
+                "boxes.csv": ["box_id"],
+            },
+        )
+        self.assertEqual(
+            {entity_type.label for entity_type in schema.entity_types}, 
+            {"CUSTOMER", "ADDRESS", "PRODUCT", "CATEGORY", "STATUS", "BOX"}
+        )
+        self.assertEqual(
+            {(r.source, r.label, r.target) for r in schema.relationship_types},
+            {
+                ("CUSTOMER", "HAS_ADDRESS", "ADDRESS"),
+                ("PRODUCT", "HAS_CATEGORY", "CATEGORY"),
+                ("PRODUCT", "HAS_STATUS", "STATUS"),
+            },
+        )
+
+    def test_two_entity_filename_without_unique_id_is_a_full_relationship(self):
+        schema = _heuristic_schema(
+            {
+                "customers.csv": sample("customer_id", "name"),
+                "products.csv": sample("product_id", "title"),
+                "customer_products.csv": sample("customer_id", "product_id", "date"),
+            },
+            {"customers.csv": ["customer_id"], "products.csv": ["product_id"], "customer_products.csv": []},
+        )
+        self.assertEqual(
+            [(r.source, r.label, r.target) for r in schema.relationship_types], 
+            [("CUSTOMER", "CUSTOMER_PRODUCT", "PRODUCT")]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,165 @@
+import asyncio
+import unittest
+from unittest import mock
+
+from agno.agent import Agent
+from agno.workflow import Workflow
+
+from src.common import UserGoal
+from src.common.structured import CSVFile, EntityType, RelationshipType, StructuredSchema
+from src.workflow.structured import schema_critic_loop
+from src.workflow.structured.schema_critic_loop import CRITIC_APPROVAL, SchemaCriticLoop, get_instruction_cache, is_approval
+
+
+class FakeModel:
+    id = "fake-model"
+
+
+class TestGetInstructionCache(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        caches = mock.patch.dict(schema_critic_loop._instruction_caches, clear=True)
+        caches.start()
+        self.addCleanup(caches.stop)
+
+    async def test_concurrent_callers_share_one_creation(self):
+        create = mock.AsyncMock(return_value="caches/1")
+        with mock.patch.object(schema_critic_loop, "create_instruction_cache", create):
+            names = await asyncio.gather(*[get_instruction_cache(FakeModel(), "instructions") for _ in range(3)])
+
+        self.assertEqual(names, ["caches/1"] * 3)
+        create.assert_awaited_once()
+
+    async def test_cancelled_caller_does_not_cancel_shared_creation(self):
+        created = asyncio.Event()
+
+        async def create(model, instructions):
+            await created.wait()
+            return "caches/1"
+
+        with mock.patch.object(schema_critic_loop, "create_instruction_cache", create):
+            first = asyncio.create_task(get_instruction_cache(FakeModel(), "instructions"))
+            await asyncio.sleep(0)
+            first.cancel()
+            created.set()
+            self.assertEqual(await get_instruction_cache(FakeModel(), "instructions"), "caches/1")
+
+    async def test_cancelled_creation_is_recreated(self):
+        async def create(model, instructions):
+            raise asyncio.CancelledError
+
+        with mock.patch.object(schema_critic_loop, "create_instruction_cache", create):
+            with self.assertRaises(asyncio.CancelledError):
+                await get_instruction_cache(FakeModel(), "instructions")
+
+        with mock.patch.object(schema_critic_loop, "create_instruction_cache", mock.AsyncMock(return_value="caches/2")):
+            self.assertEqual(await get_instruction_cache(FakeModel(), "instructions"), "caches/2")
+
+
+def schema(*labels: str) -> StructuredSchema:
+    return StructuredSchema(entity_types=[EntityType(label=label, fields=["id"]) for label in labels], relationship_types=[])
+
+
+class StubbedAgentsTestCase(unittest.IsolatedAsyncioTestCase):
+    """ 
+    Runs loops with the agents' arun stubbed out: proposals are taken from self.proposals in turn, and critiques from self.critiques in turn. 
+    Instruction caching & the debug log file are disabled.
+    """
+    proposals: list
+    critiques: list
+
+    def setUp(self):
+        self.proposal_calls, self.critic_calls = 0, 0
+
+        async def arun(agent, input, **kwargs):
+            if agent.name == "proposal-agent":
+                self.proposal_calls += 1
+                return mock.Mock(content=self.proposals[self.proposal_calls - 1])
+            self.critic_calls += 1
+            return mock.Mock(content=self.critiques[self.critic_calls - 1])
+
+        for patch in (
+            mock.patch.object(Agent, "arun", arun),
+            mock.patch.object(schema_critic_loop, "create_instruction_cache", mock.AsyncMock(return_value=None)),
+            mock.patch.object(schema_critic_loop, "open", mock.mock_open(), create=True),
+            mock.patch.dict(schema_critic_loop._response_cache, clear=True),
+        ):
+            patch.start()
+            self.addCleanup(patch.stop)
+
+        self.files = {"customers.csv": CSVFile.from_bytes("customers.csv", b"customer_id,name\n1,a\n2,b\n")}
+        self.user_goal = UserGoal(kind_of_graph="customers", description="Customer analysis")
+
+    async def run_loop(self, critic_loop: SchemaCriticLoop) -> SchemaCriticLoop.LoopState:
+        """ Runs the loop to completion in a workflow over self.files, returning its final state """
+        critic_loop.reset()
+        await Workflow(
+            name="test-workflow", 
+            session_state={"files": self.files, "user_goal": self.user_goal}, 
+            steps=[critic_loop.get_loop()],
+        ).arun(input=self.user_goal.description)
+        return critic_loop.last_iteration_output_content
+
+
+class TestRunBatch(StubbedAgentsTestCase):
+
+    async def test_approved_run_returns_schema(self):
+        self.proposals, self.critiques = [schema("CUSTOMER")], [CRITIC_APPROVAL]
+        results = await SchemaCriticLoop.run_batch([{"files": self.files, "user_goal": self.user_goal}])
+        self.assertEqual(results, [schema("CUSTOMER")])
+
+    async def test_unapproved_run_returns_none(self):
+        self.proposals, self.critiques = [schema("CUSTOMER"), schema("PERSON")], ["Rename CUSTOMER", "Rename PERSON"]
+        results = await SchemaCriticLoop.run_batch([{"files": self.files, "user_goal": self.user_goal}], max_iterations=2)
+        self.assertEqual(results, [None])
+        self.assertEqual((self.proposal_calls, self.critic_calls), (2, 2))
+
+
+
+class TestCritiqueSchema(StubbedAgentsTestCase):
+
+    async def test_reused_approval_ends_loop_without_critic_call(self):
+        critic_loop = SchemaCriticLoop(max_iterations=3)
+        self.proposals, self.critiques = [schema("CUSTOMER", "REGION"), schema("region", "customer")], [CRITIC_APPROVAL]
+
+        await self.run_loop(critic_loop)
+        final_state = await self.run_loop(critic_loop) # Re-proposes an equivalent schema
+
+        self.assertEqual(final_state.critic_feedback, CRITIC_APPROVAL)
+        self.assertEqual((self.proposal_calls, self.critic_calls), (2, 1))
+
+    async def test_repeated_rejection_is_replayed_as_a_repeat(self):
+        self.proposals = [schema("CUSTOMER"), schema("PERSON"), schema("CUSTOMER")]
+        self.critiques = ["Rename CUSTOMER", "Rename PERSON"]
+
+        final_state = await self.run_loop(SchemaCriticLoop(max_iterations=3))
+
+        self.assertEqual(self.critic_calls, 2)
+        self.assertTrue(final_state.critic_feedback.startswith("You have already proposed this schema"))
+        self.assertTrue(final_state.critic_feedback.endswith("Rename CUSTOMER"))
+
+    async def test_approval_with_objection_is_not_an_approval(self):
+        self.proposals, self.critiques = [schema("CUSTOMER"), schema("CLIENT")], ["APPROVED, but rename CUSTOMER to CLIENT", "APPROVED."]
+
+        final_state = await self.run_loop(SchemaCriticLoop(max_iterations=3))
+
+        self.assertEqual(final_state.critic_feedback, CRITIC_APPROVAL)
+        self.assertEqual(final_state.proposed_schema, schema("CLIENT"))
+        self.assertEqual((self.proposal_calls, self.critic_calls), (2, 2))
+
+
+class TestIsApproval(unittest.TestCase):
+
+    def test_exact_approval(self):
+        for feedback in ("APPROVED", " APPROVED.\n", "APPROVED!"):
+            with self.subTest(feedback=feedback):
+                self.assertTrue(is_approval(feedback))
+
+    def test_objections_are_not_approvals(self):
+        for feedback in ("APPROVED, but rename X", "APPROVED except the PERSON entity", "Not APPROVED", "Rename X", ""):
+            with self.subTest(feedback=feedback):
+                self.assertFalse(is_approval(feedback))
+
+
+if __name__ == "__main__":
+    unittest.main()
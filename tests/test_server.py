@@ -0,0 +1,68 @@
+import unittest
+from collections import OrderedDict
+from unittest import mock
+
+from src.service import server
+
+
+class TestWorkflowStore(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 1000.0
+        for patch in (
+            mock.patch.object(server, "WORKFLOWS", OrderedDict()),
+            mock.patch.object(server, "MAX_WORKFLOWS", 2),
+            mock.patch.object(server.time, "monotonic", lambda: self.now),
+        ):
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_get_returns_stored_workflow(self):
+        workflow = object()
+        server.store_workflow("a", workflow)
+        self.assertIs(server.get_workflow("a"), workflow)
+        self.assertIsNone(server.get_workflow("missing"))
+        self.assertIsNone(server.get_workflow(None))
+
+    def test_workflow_expires_after_ttl_since_last_use(self):
+        workflow = object()
+        server.store_workflow("a", workflow)
+
+        self.now += server.WORKFLOW_TTL_SECONDS - 1
+        self.assertIs(server.get_workflow("a"), workflow) # Use refreshes the expiry
+
+        self.now += server.WORKFLOW_TTL_SECONDS - 1
+        self.assertIs(server.get_workflow("a"), workflow)
+
+        self.now += server.WORKFLOW_TTL_SECONDS
+        self.assertIsNone(server.get_workflow("a"))
+        self.assertNotIn("a", server.WORKFLOWS)
+
+    def test_least_recently_used_workflow_is_evicted_at_cap(self):
+        server.store_workflow("a", object())
+        server.store_workflow("b", object())
+        server.get_workflow("a") # "b" is now least recently used
+
+        server.store_workflow("c", object())
+
+        self.assertEqual(list(server.WORKFLOWS), ["a", "c"])
+
+    def test_expired_workflows_are_evicted_before_live_ones(self):
+        server.store_workflow("a", object())
+        self.now += 1
+        server.store_workflow("b", object())
+        self.now += server.WORKFLOW_TTL_SECONDS - 0.5 # "a" expired, "b" still live
+
+        server.store_workflow("c", object())
+
+        self.assertEqual(list(server.WORKFLOWS), ["b", "c"])
+
+    def test_discard_removes_workflow(self):
+        server.store_workflow("a", object())
+        server.discard_workflow("a")
+        server.discard_workflow("missing")
+        self.assertIsNone(server.get_workflow("a"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+import unittest
+
+from src.common.structured import CSVFile, EntityType, RelationshipType, StructuredSchema
+
+
+class TestCSVFileFromBytes(unittest.TestCase):
+
+    def test_ragged_rows_are_padded_with_nulls(self):
+        file = CSVFile.from_bytes("ragged.csv", b"a,b\n1,2\n3\n")
+        self.assertEqual(list(file.content.columns), ["a", "b"])
+        self.assertEqual(len(file.content), 2)
+        self.assertTrue(file.content["b"].isna().iloc[1])
+        self.assertEqual(file.sample().rows, [["1", "2"], ["3", ""]])
+
+    def test_duplicate_headers_are_renamed_like_pandas(self):
+        file = CSVFile.from_bytes("duplicates.csv", b"id,name,id\n1,x,2\n2,y,3\n")
+        self.assertEqual(list(file.content.columns), ["id", "name", "id.1"])
+        self.assertEqual(file.sample().columns, ["id", "name", "id.1"])
+        self.assertEqual(file.unique_columns(), ["id", "name", "id.1"])
+
+
+
+class TestCSVFileUniqueColumns(unittest.TestCase):
+
+    def test_unique_non_null_columns(self):
+        file = CSVFile.from_bytes("customers.csv", b"customer_id,name,score\n1,a,5\n2,a,\n3,b,7\n")
+        self.assertEqual(file.unique_columns(), ["customer_id"])
+
+    def test_too_few_rows_have_no_unique_columns(self):
+        for data in (b"customer_id,product_id,date\n", b"customer_id,product_id,date\n1,2,2024-01-01\n"):
+            with self.subTest(data=data):
+                self.assertEqual(CSVFile.from_bytes("customer_products.csv", data).unique_columns(), [])
+
+
+
+class TestStructuredSchema(unittest.TestCase):
+
+    def test_canonical_key_ignores_order_and_label_case(self):
+        schema = StructuredSchema(
+            entity_types=[EntityType(label="PERSON", fields=["person_id", "name"]), EntityType(label="COMPANY", fields=["company_id"])],
+            relationship_types=[RelationshipType(label="WORKS_AT", source="PERSON", target="COMPANY")],
+        )
+        equivalent = StructuredSchema(
+            entity_types=[EntityType(label="company", fields=["company_id"]), EntityType(label="Person", fields=["name", "person_id"])],
+            relationship_types=[RelationshipType(label="works_at", source="person", target="company")],
+        )
+        different = StructuredSchema(entity_types=schema.entity_types, relationship_types=[])
+
+        self.assertEqual(schema.canonical_key(), equivalent.canonical_key())
+        self.assertNotEqual(schema.canonical_key(), different.canonical_key())
+
+    def test_merge_combines_entity_fields_and_dedupes_relationships(self):
+        merged = StructuredSchema.merge([
+            StructuredSchema(
+                entity_types=[EntityType(label="PERSON", fields=["person_id", "name"])],
+                relationship_types=[RelationshipType(label="WORKS_AT", source="PERSON", target="COMPANY")],
+            ),
+            StructuredSchema(
+                entity_types=[EntityType(label="Person", fields=["name", "age"]), EntityType(label="COMPANY", fields=["company_id"])],
+                relationship_types=[RelationshipType(label="works_at", source="person", target="company")],
+            ),
+        ])
+
+        self.assertEqual(merged.entity_types, [
+            EntityType(label="PERSON", fields=["person_id", "name", "age"]), 
+            EntityType(label="COMPANY", fields=["company_id"]),
+        ])
+        self.assertEqual(merged.relationship_types, [RelationshipType(label="WORKS_AT", source="PERSON", target="COMPANY")])
+
+
+if __name__ == "__main__":
+    unittest.main()
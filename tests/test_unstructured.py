@@ -0,0 +1,74 @@
+import os
+import stat
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from src.common import unstructured
+from src.common.unstructured import UnstructuredFile
+
+
+class FakeConverter:
+    """ Stands in for MarkItDown, counting conversions """
+
+    def __init__(self):
+        self.conversions = 0
+
+    def convert(self, stream):
+        self.conversions += 1
+        return mock.Mock(title="Title", markdown=stream.read().decode())
+
+
+class TestUnstructuredFileCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_home = tempfile.TemporaryDirectory()
+        self.addCleanup(self.cache_home.cleanup)
+        env = mock.patch.dict(os.environ, {"XDG_CACHE_HOME": self.cache_home.name})
+        env.start()
+        self.addCleanup(env.stop)
+
+        self.converter = FakeConverter()
+        md = mock.patch.object(UnstructuredFile, "_md", self.converter)
+        md.start()
+        self.addCleanup(md.stop)
+
+    def cache_dir(self) -> Path:
+        return Path(self.cache_home.name) / unstructured._CACHE_SUBDIR
+
+    def test_miss_converts_and_caches_then_hit_skips_conversion(self):
+        first = UnstructuredFile.from_bytes("doc.md", b"# hello")
+        second = UnstructuredFile.from_bytes("copy.md", b"# hello")
+
+        self.assertEqual(self.converter.conversions, 1)
+        self.assertEqual((second.name, second.doc_title, second.content), ("copy.md", first.doc_title, first.content))
+        self.assertEqual(len(list(self.cache_dir().glob("*.json"))), 1)
+        self.assertEqual(stat.S_IMODE(self.cache_dir().stat().st_mode), 0o700)
+
+    def test_failed_write_still_returns_conversion(self):
+        with mock.patch.object(unstructured.json, "dump", side_effect=OSError(28, "No space left on device")):
+            file = UnstructuredFile.from_bytes("doc.md", b"# hello")
+
+        self.assertEqual(file.content, "# hello")
+        self.assertEqual(list(self.cache_dir().iterdir()), []) # Temp file cleaned up, nothing cached
+
+    def test_shared_cache_dir_is_not_used(self):
+        self.cache_dir().mkdir(parents=True)
+        self.cache_dir().chmod(0o777)
+
+        UnstructuredFile.from_bytes("doc.md", b"# hello")
+        UnstructuredFile.from_bytes("doc.md", b"# hello")
+
+        self.assertEqual(self.converter.conversions, 2)
+        self.assertEqual(list(self.cache_dir().iterdir()), [])
+
+    def test_unresolvable_home_disables_cache(self):
+        with mock.patch.dict(os.environ, {"XDG_CACHE_HOME": ""}), mock.patch.object(Path, "home", side_effect=RuntimeError):
+            file = UnstructuredFile.from_bytes("doc.md", b"# hello")
+
+        self.assertEqual(file.content, "# hello")
+
+
+if __name__ == "__main__":
+    unittest.main()